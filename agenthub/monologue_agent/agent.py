@@ -84,14 +84,15 @@ class MonologueAgent(Agent):
         self.monologue = Monologue()
         self.memory = LongTermMemory()
 
-    def _add_event(self, event: dict):
+    def _add_event(self, event: dict, type_tag: str, remember: bool = True):
         if "extras" in event and "screenshot" in event["extras"]:
             del event["extras"]["screenshot"]
         if 'args' in event and 'output' in event['args'] and len(event['args']['output']) > MAX_OUTPUT_LENGTH:
             event['args']['output'] = event['args']['output'][:MAX_OUTPUT_LENGTH] + "..."
 
         self.monologue.add_event(event)
-        self.memory.add_event(event)
+        if remember:
+            self.memory.add_typed_event(event, type_tag, event[type_tag])
         if self.monologue.get_total_length() > MAX_MONOLOGUE_LENGTH:
             self.monologue.condense(self.llm)
 
@@ -102,7 +103,11 @@ class MonologueAgent(Agent):
         if task is None or task == "":
             raise ValueError("Instruction must be provided")
         self.monologue = Monologue()
-        self.memory = LongTermMemory()
+        self.memory.close()
+        self.memory = LongTermMemory.for_task(task)
+        # Memories reopened from an earlier run of the task already hold
+        # the initial thoughts.
+        remember = self.memory.thought_idx == 0
 
         output_type = ""
         for thought in INITIAL_THOUGHTS:
@@ -117,7 +122,7 @@ class MonologueAgent(Agent):
                     observation = AgentRecallObservation(content=thought, memories=[])
                 elif output_type == "browse":
                     observation = BrowserOutputObservation(content=thought, url="", screenshot="")
-                self._add_event(observation.to_dict())
+                self._add_event(observation.to_dict(), "observation", remember)
                 output_type = ""
             else:
                 action: Action = NullAction()
@@ -144,14 +149,14 @@ class MonologueAgent(Agent):
                     output_type = "browse"
                 else:
                     action = AgentThinkAction(thought=thought)
-                self._add_event(action.to_dict())
+                self._add_event(action.to_dict(), "action", remember)
         self._initialized = True
 
     def step(self, state: State) -> Action:
         self._initialize(state.plan.main_goal)
         for prev_action, obs in state.updated_info:
-            self._add_event(prev_action.to_dict())
-            self._add_event(obs.to_dict())
+            self._add_event(prev_action.to_dict(), "action")
+            self._add_event(obs.to_dict(), "observation")
 
         state.updated_info = []
 
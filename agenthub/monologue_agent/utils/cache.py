@@ -0,0 +1,295 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Callable, Hashable, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+_NORM_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Folds case, whitespace and trailing punctuation, so that near-identical
+    texts share a cache entry.
+    """
+    return _NORM_RE.sub(" ", text.strip().lower()).rstrip(".?!")
+
+
+class EmbeddingCache:
+    """
+    A SQLite-backed store of embeddings, keyed by a hash of the model and the text.
+    Once it holds more than `max_entries` vectors, the least recently used
+    ones are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            # Written by earlier versions, whose keys left out the embedding size.
+            self._db.execute("DROP TABLE IF EXISTS embeddings")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB, used REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS vectors_used ON vectors (used)")
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}|{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> dict:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock, self._db:
+            rows = self._db.execute(
+                f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})",
+                keys,
+            ).fetchall()
+            if rows:
+                hits = [key for key, _ in rows]
+                self._db.execute(
+                    f"UPDATE vectors SET used = ? WHERE key IN ({','.join('?' * len(hits))})",
+                    [time.time(), *hits],
+                )
+        found = {}
+        for key, blob in rows:
+            # Stored as float32, which is plenty for similarity search and
+            # half the size of a Python float.
+            vector = array("f")
+            vector.frombytes(blob)
+            found[key] = vector.tolist()
+        return found
+
+    def set_many(self, items: dict):
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector, used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._db.execute(
+                "DELETE FROM vectors WHERE key IN "
+                "(SELECT key FROM vectors ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model so that texts it has already embedded are read from
+    an EmbeddingCache instead of calling the model again.
+    """
+
+    _model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _dimension: Optional[int] = PrivateAttr(default=None)
+
+    def __init__(self, model: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(
+            model_name=model.model_name,
+            embed_batch_size=model.embed_batch_size,
+            callback_manager=model.callback_manager,
+            **kwargs,
+        )
+        self._model = model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _namespace(self, kind: str) -> str:
+        # The same model can be set up to return embeddings of different
+        # sizes, which a model's settings don't always show, so the size is
+        # found out by embedding a probe text once.
+        if self._dimension is None:
+            self._dimension = len(self._model.get_text_embedding("dimension"))
+        # Query and text embeddings can differ for the same model (e.g. models
+        # that prepend an instruction to queries), so they are cached apart.
+        return f"{kind}|{self._model.class_name()}|{self._model.model_name}|{self._dimension}"
+
+    def _lookup(self, kind: str, texts: List[str]):
+        namespace = self._namespace(kind)
+        keys = [EmbeddingCache.key(namespace, normalize_text(text)) for text in texts]
+        return keys, self._cache.get_many(list(set(keys)))
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, found = self._lookup("query", [query])
+        if keys[0] in found:
+            return found[keys[0]]
+        embedding = self._model.get_query_embedding(query)
+        self._cache.set_many({keys[0]: embedding})
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        keys, found = self._lookup("query", [query])
+        if keys[0] in found:
+            return found[keys[0]]
+        embedding = await self._model.aget_query_embedding(query)
+        self._cache.set_many({keys[0]: embedding})
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _misses(self, keys: List[str], texts: List[str], found: dict) -> dict:
+        # Maps each uncached key to its text, so duplicates are embedded once.
+        return {key: text for key, text in zip(keys, texts) if key not in found}
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found = self._lookup("text", texts)
+        misses = self._misses(keys, texts, found)
+        if misses:
+            embeddings = self._model.get_text_embedding_batch(list(misses.values()))
+            computed = dict(zip(misses.keys(), embeddings))
+            self._cache.set_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, found = self._lookup("text", texts)
+        misses = self._misses(keys, texts, found)
+        if misses:
+            embeddings = await self._model.aget_text_embedding_batch(list(misses.values()))
+            computed = dict(zip(misses.keys(), embeddings))
+            self._cache.set_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+
+def cache_embeddings(model: BaseEmbedding, path: Optional[str], max_entries: int) -> BaseEmbedding:
+    """
+    Returns the model wrapped with an on-disk embedding cache at `path` that
+    holds up to `max_entries` embeddings, or the model itself if no path is set.
+    """
+    if not path:
+        return model
+    return CachedEmbedding(model, EmbeddingCache(path, max_entries))
+
+
+class SearchCache:
+    """
+    Remembers the results of recent searches, so that a query whose embedding is
+    close enough to a previous one gets the same results without a retrieval.
+    Entries are evicted first in, first out.
+
+    Each entry also keeps the squared L2 distance of its worst result (the
+    distance Chroma ranks by), so that inserting new memories only drops the
+    entries those memories could have made it into.
+    """
+
+    def __init__(self, size: int = 128, threshold: float = 0.97):
+        self.size = size
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._queries: Optional[np.ndarray] = None
+        self._embeddings: Optional[np.ndarray] = None
+        self._cutoffs = np.full(size, np.inf)
+        self._keys: List[Optional[Hashable]] = [None] * size
+        self._results: List[Optional[List[str]]] = [None] * size
+        self._next = 0
+        self.generation = 0
+
+    @staticmethod
+    def _normalize(embedding: Embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding: Embedding, key: Hashable) -> Optional[List[str]]:
+        """
+        Returns the cached results for a similar query with the same key, if any.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._embeddings is None:
+                return None
+            sims = self._embeddings @ vector
+            for i in np.argsort(sims)[::-1]:
+                if sims[i] < self.threshold:
+                    break
+                if self._keys[i] == key:
+                    return list(self._results[i])
+        return None
+
+    def put(
+        self,
+        embedding: Embedding,
+        key: Hashable,
+        results: List[str],
+        cutoff: float,
+        generation: int,
+    ):
+        """
+        Caches the results of a search, unless memories were inserted (or the
+        cache cleared) since `generation` was read, i.e. the results may
+        already be stale. `cutoff` is the squared L2 distance from the query
+        to its worst result, or infinity if the search returned fewer results
+        than it asked for.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._queries is None or self._embeddings is None:
+                self._queries = np.zeros((self.size, query.shape[0]), dtype=np.float32)
+                self._embeddings = np.zeros((self.size, query.shape[0]), dtype=np.float32)
+            self._queries[self._next] = query
+            self._embeddings[self._next] = self._normalize(embedding)
+            self._cutoffs[self._next] = cutoff
+            self._keys[self._next] = key
+            self._results[self._next] = results
+            self._next = (self._next + 1) % self.size
+
+    def invalidate(self, embeddings: List[Embedding], eligible: Callable[[Hashable], np.ndarray]):
+        """
+        Drops the entries that the newly inserted `embeddings` could appear in.
+        `eligible(key)` returns a boolean mask of the new embeddings that a
+        search with that key can return at all (e.g. those passing its filters).
+        """
+        inserted = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self.generation += 1
+            if self._queries is None or not len(inserted):
+                return
+            for i, key in enumerate(self._keys):
+                if key is None:
+                    continue
+                candidates = inserted[eligible(key)]
+                if not len(candidates):
+                    continue
+                distance = ((candidates - self._queries[i]) ** 2).sum(axis=1).min()
+                if distance <= self._cutoffs[i]:
+                    self._drop(i)
+
+    def _drop(self, i: int):
+        # An all-zero row never reaches the similarity threshold.
+        assert self._queries is not None and self._embeddings is not None
+        self._queries[i] = 0
+        self._embeddings[i] = 0
+        self._keys[i] = None
+        self._results[i] = None
+
+    def clear(self):
+        with self._lock:
+            self._queries = None
+            self._embeddings = None
+            self._keys = [None] * self.size
+            self._results = [None] * self.size
+            self._next = 0
+            self.generation += 1
@@ -1,79 +1,520 @@
+import asyncio
+import hashlib
+import math
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import chromadb
-from llama_index.core import Document
+import httpx
+import numpy as np
+import openai
+from chromadb.errors import ChromaError
 from llama_index.core.retrievers import VectorIndexRetriever
 from llama_index.core import VectorStoreIndex
+from llama_index.core.schema import MetadataMode, QueryBundle, TextNode
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
 from opendevin import config
 from . import json
+from .cache import SearchCache, cache_embeddings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
 
 embedding_strategy = config.get("LLM_EMBEDDING_MODEL")
+memory_max_threads = int(config.get("LLM_MEMORY_MAX_THREADS"))
+memory_batch_size = int(config.get("LLM_MEMORY_BATCH_SIZE"))
+memory_persist_path = config.get("LLM_MEMORY_PERSIST_PATH")
 
-# TODO: More embeddings: https://docs.llamaindex.ai/en/stable/examples/embeddings/OpenAI/
-# There's probably a more programmatic way to do this.
-if embedding_strategy == "llama2":
+# Every memory is tagged with one of these, so they are shared rather than
+# stored as a separate string per event.
+_ACTION = sys.intern("action")
+_OBSERVATION = sys.intern("observation")
+
+
+def _event_type(event):
+    if _ACTION in event:
+        return _ACTION, event[_ACTION]
+    if _OBSERVATION in event:
+        return _OBSERVATION, event[_OBSERVATION]
+    return "", ""
+
+
+def _embed_texts(nodes):
+    return [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+
+
+# What a failed insert is expected to raise: the embedding request (HTTP or
+# OpenAI client errors, or a local model's RuntimeError) and Chroma's write.
+_INSERT_ERRORS = (
+    ChromaError,
+    ValueError,
+    RuntimeError,
+    OSError,
+    httpx.HTTPError,
+    openai.OpenAIError,
+)
+
+# How long the batcher waits for more events before inserting a partial batch.
+BATCH_WINDOW = 0.05
+
+
+def _dumps(event):
+    # orjson is much faster on large events, but is optional and stricter
+    # about what it can encode than the standard library. The fallback is
+    # formatted like orjson's output, so the stored text (and its embedding
+    # cache key) doesn't depend on which encoder was used.
+    if orjson is not None:
+        try:
+            return orjson.dumps(event, default=json.my_encoder).decode()
+        except TypeError:
+            pass
+    return json.dumps(event, separators=(",", ":"), ensure_ascii=False)
+
+
+# Embedding models served by Ollama; the strategy name is the Ollama model name.
+_OLLAMA_EMBED_MODELS: frozenset[str] = frozenset({"llama2"})
+
+
+def _ollama_embedding(strategy):
     from llama_index.embeddings.ollama import OllamaEmbedding
-    embed_model = OllamaEmbedding(
-        model_name="llama2",
+    return OllamaEmbedding(
+        model_name=strategy,
         base_url=config.get_or_error("LLM_BASE_URL"),
         ollama_additional_kwargs={"mirostat": 0},
     )
-elif embedding_strategy == "openai":
+
+
+# Failed OpenAI and Azure embedding requests, rate limits included, are
+# retried with random exponential backoff inside llama-index, not here.
+def _openai_embedding(strategy):
     from llama_index.embeddings.openai import OpenAIEmbedding
-    embed_model = OpenAIEmbedding(
+    return OpenAIEmbedding(
         base_url=config.get_or_error("LLM_BASE_URL"),
     )
-elif embedding_strategy == "azureopenai":
+
+
+def _azure_openai_embedding(strategy):
     from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding  # Need to instruct to set these env variables in documentation
-    embed_model = AzureOpenAIEmbedding(
+    return AzureOpenAIEmbedding(
         model="text-embedding-ada-002",
         deployment_name=config.get_or_error("LLM_DEPLOYMENT_NAME"),
         api_key=config.get_or_error("LLM_API_KEY"),
         azure_endpoint=config.get_or_error("LLM_BASE_URL"),
         api_version=config.get_or_error("LLM_API_VERSION"),
     )
-else:
+
+
+def _huggingface_embedding(strategy):
     from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-    embed_model = HuggingFaceEmbedding(
+    return HuggingFaceEmbedding(
         model_name="BAAI/bge-small-en-v1.5"
     )
 
 
+# TODO: More embeddings: https://docs.llamaindex.ai/en/stable/examples/embeddings/OpenAI/
+# Any strategy not listed here falls back to a local HuggingFace model.
+# "none" disables long-term memory altogether.
+_STRATEGY_TABLE = {
+    "none": lambda strategy: None,
+    "openai": _openai_embedding,
+    "azureopenai": _azure_openai_embedding,
+    **{model: _ollama_embedding for model in _OLLAMA_EMBED_MODELS},
+}
+
+embed_model = _STRATEGY_TABLE.get(embedding_strategy, _huggingface_embedding)(embedding_strategy)
+
+# With a cache path set, identical events (and repeated recall queries) are
+# embedded only once.
+if embed_model is not None:
+    embed_model = cache_embeddings(
+        embed_model,
+        config.get("LLM_EMBEDDING_CACHE_PATH"),
+        int(config.get("LLM_EMBEDDING_CACHE_SIZE")),
+    )
+
+
 class LongTermMemory:
-    def __init__(self):
-        db = chromadb.Client()
-        self.collection = db.get_or_create_collection(name="memories")
+    def __init__(self, session_id=None):
+        """
+        Memories are kept in a Chroma collection of their own for each session
+        and embedding model. With LLM_MEMORY_PERSIST_PATH set, passing the same
+        `session_id` again reopens the memories stored under it. Without a
+        `session_id` the instance starts empty and close() drops its memories.
+        """
+        self.thought_idx = 0
+        self.session_id = session_id or uuid.uuid4().hex
+        # Nothing else knows a generated session id, so its collection would
+        # never be read again.
+        self._drop_on_close = session_id is None
+        # Without an embedding model there is nothing to store or search, so
+        # none of the index, worker threads or caches are set up.
+        self._enabled = embed_model is not None
+        self._closed = False
+        if not self._enabled:
+            return
+        settings = chromadb.Settings(anonymized_telemetry=False)
+        if memory_persist_path:
+            # Memories (and their embeddings) survive restarts, so earlier
+            # events never have to be embedded again.
+            db = chromadb.PersistentClient(
+                path=os.path.expanduser(memory_persist_path),
+                settings=settings,
+            )
+        else:
+            db = chromadb.Client(settings)
+        self._db = db
+        # Embeddings from different models (or of different sizes) can't
+        # share a collection, so the model is part of its name.
+        model_key = hashlib.sha256(
+            f"{embedding_strategy}|{embed_model.model_name}".encode("utf-8")
+        ).hexdigest()[:12]
+        # The search cache decides which cached searches a new memory could
+        # change by squared L2 distance, so that is what Chroma must rank by.
+        self.collection = db.get_or_create_collection(
+            name=f"memories-{model_key}-{self.session_id}",
+            metadata={"hnsw:space": "l2"},
+        )
+        # Continue numbering after any memories reopened from disk.
+        self.thought_idx = self.collection.count()
         vector_store = ChromaVectorStore(chroma_collection=self.collection)
         self.index = VectorStoreIndex.from_vector_store(vector_store, embed_model=embed_model)
-        self.thought_idx = 0
+        # Inserts embed the event text, which is slow, so they run on a
+        # fixed pool of worker threads instead of blocking the agent.
+        # Events are queued and coalesced into batches first, so that each
+        # batch costs one embedding request and one Chroma write.
+        self._queue: queue.Queue = queue.Queue()
+        # Counts events that are queued or being inserted; `_idle` is set
+        # whenever it drops to zero, which is what flush() waits for.
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=memory_max_threads,
+            thread_name_prefix="ltm-insert",
+        )
+        self._batcher = threading.Thread(
+            target=self._batch_events,
+            name="ltm-batcher",
+            daemon=True,
+        )
+        self._batcher.start()
+        # Created on first use of add_event_async, on the caller's event loop.
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_queue: Optional[asyncio.Queue] = None
+        self._async_batcher: Optional[asyncio.Task] = None
+        self._search_cache = SearchCache()
+        self._retrievers: dict[tuple, VectorIndexRetriever] = {}
+        self._get_retriever(10)
+
+    @classmethod
+    def for_task(cls, task):
+        """
+        Returns the memory for an agent working on `task`: the memories of
+        earlier runs of the same task when they are persisted, otherwise an
+        empty one.
+        """
+        if not memory_persist_path:
+            return cls()
+        return cls(session_id=hashlib.sha256(task.encode("utf-8")).hexdigest()[:16])
 
     def add_event(self, event):
-        id = ""
-        t = ""
-        if "action" in event:
-            t = "action"
-            id = event["action"]
-        elif "observation" in event:
-            t = "observation"
-            id = event["observation"]
-        doc = Document(
-            text=json.dumps(event),
-            doc_id=str(self.thought_idx),
-            extra_info={
-                "type": t,
-                "id": id,
-                "idx": self.thought_idx,
-            },
-        )
+        """
+        Adds a serialized action or observation, working out its type from the
+        dict. Callers that already know the type should use add_typed_event.
+        """
+        # Events that are neither are stored with an empty type.
+        t, id = _event_type(event)
+        self._enqueue(event, t, id)
+
+    def add_typed_event(self, event, type_tag, type_id):
+        """
+        Adds an event whose memory tag is already known: `type_tag` is "action"
+        or "observation" and `type_id` the action or observation name.
+        """
+        if type_tag not in (_ACTION, _OBSERVATION):
+            raise ValueError(f"Unknown event type tag: {type_tag!r}")
+        self._enqueue(event, type_tag, type_id)
+
+    def _enqueue(self, event, t, id):
+        if not self._enabled:
+            return
+        # Serializing large events is left to the insert workers, so the
+        # agent only pays for queueing the event.
+        self._queue.put(self._make_entry(event, t, id))
+
+    async def add_event_async(self, event):
+        """
+        Like add_event (untyped events included), but the event is embedded
+        and inserted by a task on the running event loop rather than by the
+        worker threads.
+        """
+        if not self._enabled:
+            return
+        t, id = _event_type(event)
+        entry = self._make_entry(event, t, id)
+        loop = asyncio.get_running_loop()
+        events = self._async_queue
+        if events is None or self._async_loop is not loop:
+            self._stop_async_batcher()
+            events = asyncio.Queue()
+            self._async_loop = loop
+            self._async_queue = events
+            self._async_batcher = loop.create_task(self._abatch_events(events))
+            # If the loop ends (or cancels the task) first, whatever is still
+            # queued will never be inserted; stop flush() waiting for it.
+            self._async_batcher.add_done_callback(lambda _: self._drop_queued(events))
+        await events.put(entry)
+
+    def _make_entry(self, event, t, id):
+        if self._closed:
+            # Nothing would ever insert it, and flush() would wait for it.
+            raise RuntimeError("Long-term memory is closed")
+        with self._pending_lock:
+            self._pending += 1
+            self._idle.clear()
+        entry = (event, sys.intern(t), id, self.thought_idx)
         self.thought_idx += 1
-        self.index.insert(doc)
+        return entry
 
-    def search(self, query, k=10):
-        retriever = VectorIndexRetriever(
-            index=self.index,
-            similarity_top_k=k,
-        )
-        results = retriever.retrieve(query)
-        return [r.get_text() for r in results]
+    def _batch_events(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + BATCH_WINDOW
+            while len(batch) < memory_batch_size and time.monotonic() < deadline:
+                try:
+                    entry = self._queue.get(timeout=deadline - time.monotonic())
+                except queue.Empty:
+                    break
+                if entry is None:
+                    # Let the outer loop see the shutdown signal once this
+                    # batch has been handed off.
+                    self._queue.put(None)
+                    break
+                batch.append(entry)
+            self._executor.submit(self._add_events, batch)
+
+    async def _abatch_events(self, events: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await events.get()]
+                deadline = loop.time() + BATCH_WINDOW
+                while len(batch) < memory_batch_size and loop.time() < deadline:
+                    try:
+                        batch.append(await asyncio.wait_for(events.get(), deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        break
+                # _aadd_events accounts for the batch from here on.
+                entries, batch = batch, []
+                await self._aadd_events(entries)
+        finally:
+            if batch:
+                self._finish(len(batch))
+
+    def _drop_queued(self, events):
+        count = 0
+        while not events.empty():
+            events.get_nowait()
+            count += 1
+        if count:
+            self._finish(count)
+
+    def _stop_async_batcher(self):
+        task, loop, events = self._async_batcher, self._async_loop, self._async_queue
+        self._async_batcher = self._async_loop = self._async_queue = None
+        if task is None or loop is None or events is None or task.done():
+            return
+        if loop.is_running():
+            # The done callback drops whatever is left once it is cancelled.
+            loop.call_soon_threadsafe(task.cancel)
+            return
+        # Nothing is running the task, so unwind it and its queue here.
+        if not loop.is_closed():
+            task.cancel()
+        task.get_coro().close()
+        self._drop_queued(events)
+
+    def _to_nodes(self, entries):
+        # Nodes get random uuid ids, so memories sharing a session can't
+        # collide; `idx` in the metadata keeps their order.
+        return [
+            TextNode(
+                text=_dumps(event),
+                extra_info={
+                    "type": t,
+                    "id": id,
+                    "idx": idx,
+                },
+            )
+            for event, t, id, idx in entries
+        ]
+
+    def _add_events(self, entries):
+        try:
+            nodes = self._to_nodes(entries)
+            # The index only embeds nodes that have no embedding yet; these
+            # embeddings are also what the search cache is checked against.
+            embeddings = embed_model.get_text_embedding_batch(_embed_texts(nodes))
+            for node, embedding in zip(nodes, embeddings):
+                node.embedding = embedding
+            self.index.insert_nodes(nodes)
+            self._invalidate_searches(entries, embeddings)
+        except _INSERT_ERRORS as e:
+            print(f"Error adding events to long-term memory: {e}")
+        finally:
+            self._finish(len(entries))
+
+    async def _aadd_events(self, entries):
+        try:
+            nodes = self._to_nodes(entries)
+            # The index only embeds nodes that have no embedding yet. Remote
+            # models (OpenAI, Azure) embed without blocking the loop here, but
+            # local models and the embedding cache's lookups still run on it.
+            embeddings = await embed_model.aget_text_embedding_batch(_embed_texts(nodes))
+            for node, embedding in zip(nodes, embeddings):
+                node.embedding = embedding
+            # This llama-index version has no async insert, and the Chroma
+            # client is synchronous anyway.
+            await asyncio.to_thread(self.index.insert_nodes, nodes)
+            self._invalidate_searches(entries, embeddings)
+        except _INSERT_ERRORS as e:
+            print(f"Error adding events to long-term memory: {e}")
+        finally:
+            self._finish(len(entries))
+
+    def _invalidate_searches(self, entries, embeddings):
+        # New memories only change the results of searches whose filters let
+        # them through and whose worst result they beat.
+        tags = [(t, idx) for _, t, _, idx in entries]
+
+        def eligible(key):
+            _, type, min_idx = key
+            return np.array([
+                (type is None or t == type) and (min_idx is None or idx >= min_idx)
+                for t, idx in tags
+            ])
+
+        self._search_cache.invalidate(embeddings, eligible)
+
+    def _finish(self, count):
+        with self._pending_lock:
+            self._pending -= count
+            if self._pending == 0:
+                self._idle.set()
+
+    def flush(self):
+        """
+        Blocks until every event added so far has been inserted. An insert
+        that fails is reported and dropped, so its events are not searchable.
+        Don't call it from an event loop that events were added on with
+        add_event_async; await flush_async instead.
+        """
+        if not self._enabled:
+            return
+        self._idle.wait()
+
+    def _get_retriever(self, k, type=None, min_idx=None):
+        # Recency thresholds change from search to search, so retrievers that
+        # filter on one are built per call instead of piling up here.
+        key = (k, type)
+        retriever = self._retrievers.get(key) if min_idx is None else None
+        if retriever is None:
+            filters: list = []
+            if type is not None:
+                filters.append(MetadataFilter(key="type", value=type))
+            if min_idx is not None:
+                filters.append(MetadataFilter(key="idx", value=min_idx, operator=FilterOperator.GTE))
+            retriever = VectorIndexRetriever(
+                index=self.index,
+                similarity_top_k=k,
+                filters=MetadataFilters(filters=filters) if filters else None,
+            )
+            if min_idx is None:
+                self._retrievers[key] = retriever
+        return retriever
+
+    def _cutoff(self, query_embedding, results, k):
+        # A search that came back short would take any new memory.
+        if len(results) < k:
+            return math.inf
+        # Measured from the stored embeddings rather than read off the result
+        # scores, which are whatever the vector store makes of the distances.
+        stored = self.collection.get(ids=[r.node.node_id for r in results], include=["embeddings"])
+        vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        return float(((vectors - query) ** 2).sum(axis=1).max())
+
+    def search(self, query, k=10, type=None, min_idx=None):
+        """
+        Returns the k memories most similar to the query. `type` limits them to
+        "action" or "observation" events, and `min_idx` to events numbered
+        min_idx or later; both filters are applied by Chroma before ranking.
+        """
+        if not self._enabled:
+            return []
+        self.flush()
+        generation = self._search_cache.generation
+        # The one query embedding serves both the cache lookup and retrieval.
+        # With the embedding cache on, queries that only differ as far as
+        # normalize_text is concerned share that embedding.
+        query_embedding = embed_model.get_query_embedding(query)
+        texts = self._search_cache.get(query_embedding, (k, type, min_idx))
+        if texts is not None:
+            return texts
+        retriever = self._get_retriever(k, type, min_idx)
+        results = retriever.retrieve(QueryBundle(query_str=query, embedding=query_embedding))
+        texts = [r.get_text() for r in results]
+        cutoff = self._cutoff(query_embedding, results, k)
+        self._search_cache.put(query_embedding, (k, type, min_idx), texts, cutoff, generation)
+        return texts
+
+    async def flush_async(self):
+        if not self._enabled:
+            return
+        await asyncio.to_thread(self._idle.wait)
 
+    async def search_async(self, query, k=10, type=None, min_idx=None):
+        if not self._enabled:
+            return []
+        await self.flush_async()
+        generation = self._search_cache.generation
+        query_embedding = await embed_model.aget_query_embedding(query)
+        texts = self._search_cache.get(query_embedding, (k, type, min_idx))
+        if texts is not None:
+            return texts
+        retriever = self._get_retriever(k, type, min_idx)
+        results = await retriever.aretrieve(QueryBundle(query_str=query, embedding=query_embedding))
+        texts = [r.get_text() for r in results]
+        cutoff = self._cutoff(query_embedding, results, k)
+        self._search_cache.put(query_embedding, (k, type, min_idx), texts, cutoff, generation)
+        return texts
 
+    def close(self):
+        """
+        Waits for pending inserts to finish and stops the worker threads.
+        Events can't be added afterwards; closing again does nothing.
+        """
+        if not self._enabled or self._closed:
+            return
+        self._closed = True
+        self._stop_async_batcher()
+        self._queue.put(None)
+        self._batcher.join()
+        self._executor.shutdown(wait=True)
+        if self._drop_on_close:
+            self._db.delete_collection(self.collection.name)
@@ -18,7 +18,8 @@ actions = (
     ModifyTaskAction,
 )
 
-ACTION_TYPE_TO_CLASS = {action_class.action:action_class for action_class in actions} # type: ignore[attr-defined]
+# Actions are slotted dataclasses, so the `action` default lives on the field, not the class.
+ACTION_TYPE_TO_CLASS = {action_class.__dataclass_fields__["action"].default:action_class for action_class in actions} # type: ignore[attr-defined]
 
 def action_from_dict(action: dict) -> Action:
     action = action.copy()
@@ -7,7 +7,7 @@ if TYPE_CHECKING:
     from opendevin.controller import AgentController
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentRecallAction(ExecutableAction):
     query: str
     action: str = "recall"
@@ -22,7 +22,7 @@ class AgentRecallAction(ExecutableAction):
     def message(self) -> str:
         return f"Let me dive into my memories to find what you're looking for! Searching for: '{self.query}'. This might take a moment."
 
-@dataclass
+@dataclass(slots=True)
 class AgentThinkAction(NotExecutableAction):
     thought: str
     action: str = "think"
@@ -34,7 +34,7 @@ class AgentThinkAction(NotExecutableAction):
     def message(self) -> str:
         return self.thought
 
-@dataclass
+@dataclass(slots=True)
 class AgentEchoAction(ExecutableAction):
     content: str
     action: str = "echo"
@@ -46,7 +46,7 @@ class AgentEchoAction(ExecutableAction):
     def message(self) -> str:
         return self.content
 
-@dataclass
+@dataclass(slots=True)
 class AgentSummarizeAction(NotExecutableAction):
     summary: str
 
@@ -56,7 +56,7 @@ class AgentSummarizeAction(NotExecutableAction):
     def message(self) -> str:
         return self.summary
 
-@dataclass
+@dataclass(slots=True)
 class AgentFinishAction(NotExecutableAction):
     action: str = "finish"
 
@@ -5,7 +5,7 @@ if TYPE_CHECKING:
     from opendevin.controller import AgentController
     from opendevin.observation import Observation
 
-@dataclass
+@dataclass(slots=True)
 class Action:
     def run(self, controller: "AgentController") -> "Observation":
         raise NotImplementedError
@@ -26,20 +26,20 @@ class Action:
     def message(self) -> str:
         raise NotImplementedError
 
-@dataclass
+@dataclass(slots=True)
 class ExecutableAction(Action):
     @property
     def executable(self) -> bool:
         return True
 
 
-@dataclass
+@dataclass(slots=True)
 class NotExecutableAction(Action):
     @property
     def executable(self) -> bool:
         return False
 
-@dataclass
+@dataclass(slots=True)
 class NullAction(NotExecutableAction):
     """An action that does nothing.
     This is used when the agent need to receive user follow-up messages from the frontend.
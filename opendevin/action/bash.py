@@ -8,7 +8,7 @@ if TYPE_CHECKING:
     from opendevin.observation import CmdOutputObservation
 
 
-@dataclass
+@dataclass(slots=True)
 class CmdRunAction(ExecutableAction):
     command: str
     background: bool = False
@@ -21,7 +21,7 @@ class CmdRunAction(ExecutableAction):
     def message(self) -> str:
         return f"Running command: {self.command}"
 
-@dataclass
+@dataclass(slots=True)
 class CmdKillAction(ExecutableAction):
     id: int
     action: str = "kill"
@@ -9,7 +9,7 @@ from .base import ExecutableAction
 if TYPE_CHECKING:
     from opendevin.controller import AgentController
 
-@dataclass
+@dataclass(slots=True)
 class BrowseURLAction(ExecutableAction):
     url: str
     action: str = "browse"
@@ -14,7 +14,7 @@ def resolve_path(base_path, file_path):
     return os.path.join(base_path, file_path)
 
 
-@dataclass
+@dataclass(slots=True)
 class FileReadAction(ExecutableAction):
     path: str
     action: str = "read"
@@ -30,7 +30,7 @@ class FileReadAction(ExecutableAction):
     def message(self) -> str:
         return f"Reading file: {self.path}"
 
-@dataclass
+@dataclass(slots=True)
 class FileWriteAction(ExecutableAction):
     path: str
     content: str
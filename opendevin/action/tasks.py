@@ -2,7 +2,7 @@ from dataclasses import dataclass, field
 
 from .base import NotExecutableAction
 
-@dataclass
+@dataclass(slots=True)
 class AddTaskAction(NotExecutableAction):
     parent: str
     goal: str
@@ -13,7 +13,7 @@ class AddTaskAction(NotExecutableAction):
     def message(self) -> str:
         return f"Added task: {self.goal}"
 
-@dataclass
+@dataclass(slots=True)
 class ModifyTaskAction(NotExecutableAction):
     id: str
     state: str
@@ -13,6 +13,11 @@ DEFAULT_CONFIG = {
     "SANDBOX_CONTAINER_IMAGE": "ghcr.io/opendevin/sandbox",
     "RUN_AS_DEVIN": "false",
     "LLM_EMBEDDING_MODEL": "local",
+    "LLM_MEMORY_MAX_THREADS": 2,
+    "LLM_MEMORY_BATCH_SIZE": 32,
+    "LLM_MEMORY_PERSIST_PATH": "",
+    "LLM_EMBEDDING_CACHE_PATH": "",
+    "LLM_EMBEDDING_CACHE_SIZE": 100000,
     "LLM_NUM_RETRIES": 6,
     "LLM_COOLDOWN_TIME" : 1,
     "DIRECTORY_REWRITE" : "",
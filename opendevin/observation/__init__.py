@@ -17,7 +17,8 @@ observations = (
     AgentErrorObservation,
 )
 
-OBSERVATION_TYPE_TO_CLASS = {observation_class.observation:observation_class for observation_class in observations} # type: ignore[attr-defined]
+# Observations are slotted dataclasses, so the `observation` default lives on the field, not the class.
+OBSERVATION_TYPE_TO_CLASS = {observation_class.__dataclass_fields__["observation"].default:observation_class for observation_class in observations} # type: ignore[attr-defined]
 
 def observation_from_dict(observation: dict) -> Observation:
     observation = observation.copy()
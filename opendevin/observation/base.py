@@ -1,7 +1,6 @@
-import copy
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 
-@dataclass
+@dataclass(slots=True)
 class Observation:
     """
     This data class represents an observation of the environment.
@@ -14,7 +13,7 @@ class Observation:
 
     def to_dict(self) -> dict:
         """Converts the observation to a dictionary."""
-        extras = copy.deepcopy(self.__dict__)
+        extras = asdict(self)
         content = extras.pop("content", "")
         observation = extras.pop("observation", "")
         return {
@@ -30,7 +29,7 @@ class Observation:
         return ""
 
 
-@dataclass
+@dataclass(slots=True)
 class NullObservation(Observation):
     """
     This data class represents a null observation.
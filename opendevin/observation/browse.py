@@ -2,7 +2,7 @@ from dataclasses import dataclass
 
 from .base import Observation
 
-@dataclass
+@dataclass(slots=True)
 class BrowserOutputObservation(Observation):
     """
     This data class represents the output of a browser.
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 
 from .base import Observation
 
-@dataclass
+@dataclass(slots=True)
 class AgentErrorObservation(Observation):
     """
     This data class represents an error encountered by the agent.
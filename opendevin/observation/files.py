@@ -2,7 +2,7 @@ from dataclasses import dataclass
 
 from .base import Observation
 
-@dataclass
+@dataclass(slots=True)
 class FileReadObservation(Observation):
     """
     This data class represents the content of a file.
@@ -15,7 +15,7 @@ class FileReadObservation(Observation):
     def message(self) -> str:
         return f"I read the file {self.path}."
 
-@dataclass
+@dataclass(slots=True)
 class FileWriteObservation(Observation):
     """
     This data class represents a file write operation
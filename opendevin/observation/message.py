@@ -2,7 +2,7 @@ from dataclasses import dataclass
 
 from .base import Observation
 
-@dataclass
+@dataclass(slots=True)
 class UserMessageObservation(Observation):
     """
     This data class represents a message sent by the user.
@@ -16,7 +16,7 @@ class UserMessageObservation(Observation):
         return ""
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentMessageObservation(Observation):
     """
     This data class represents a message sent by the agent.
@@ -3,7 +3,7 @@ from typing import List
 
 from .base import Observation
 
-@dataclass
+@dataclass(slots=True)
 class AgentRecallObservation(Observation):
     """
     This data class represents a list of memories recalled by the agent.
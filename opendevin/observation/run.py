@@ -2,7 +2,7 @@ from dataclasses import dataclass
 
 from .base import Observation
 
-@dataclass
+@dataclass(slots=True)
 class CmdOutputObservation(Observation):
     """
     This data class represents the output of a command.
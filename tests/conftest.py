@@ -0,0 +1,5 @@
+import os
+
+# Importing anything under agenthub loads the monologue agent's long-term
+# memory, which would otherwise build (and download) an embedding model.
+os.environ.setdefault("LLM_EMBEDDING_MODEL", "none")
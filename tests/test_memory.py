@@ -0,0 +1,160 @@
+import asyncio
+import json
+from typing import List
+
+import pytest
+from chromadb.api.client import SharedSystemClient
+from llama_index.core.embeddings import BaseEmbedding
+
+from agenthub.monologue_agent.utils import memory
+from agenthub.monologue_agent.utils.memory import LongTermMemory
+
+WORDS = ["apple", "banana", "cherry", "grape"]
+
+
+class WordEmbedding(BaseEmbedding):
+    """Embeds a text as the number of times each of WORDS occurs in it."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "WordEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        return [float(text.count(word)) for word in WORDS] + [0.1]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def thought(text):
+    return {"action": "think", "args": {"thought": text}}
+
+
+def output(text):
+    return {"observation": "run", "content": text}
+
+
+@pytest.fixture
+def words(monkeypatch):
+    monkeypatch.setattr(memory, "embed_model", WordEmbedding(model_name="words"))
+
+
+@pytest.fixture
+def mem(words):
+    mem = LongTermMemory()
+    yield mem
+    mem.close()
+
+
+def test_events_are_inserted_in_batches(mem, monkeypatch):
+    monkeypatch.setattr(memory, "memory_batch_size", 2)
+    batches = []
+    insert_nodes = mem.index.insert_nodes
+
+    def record(nodes, **kwargs):
+        batches.append(len(nodes))
+        insert_nodes(nodes, **kwargs)
+
+    monkeypatch.setattr(mem.index, "insert_nodes", record)
+    for i in range(5):
+        mem.add_event(thought(f"apple {i}"))
+    mem.flush()
+    assert sum(batches) == 5 and max(batches) <= 2, 'Events should be inserted in batches of at most memory_batch_size.'
+    assert mem._pending == 0, 'Nothing should be pending once flush() returns.'
+    assert mem.collection.count() == 5
+
+
+def test_search_sees_events_added_just_before(mem):
+    mem.add_event(thought("apple"))
+    mem.add_event(output("banana"))
+    assert json.loads(mem.search("banana", k=1)[0]) == output("banana"), 'search() should wait for pending inserts.'
+
+
+def test_search_filters_by_type_and_recency(mem):
+    for event in (thought("apple one"), output("apple two"), thought("apple three")):
+        mem.add_event(event)
+    observations = [json.loads(text) for text in mem.search("apple", type="observation")]
+    assert observations == [output("apple two")], 'Only observations should be returned.'
+    recent = [json.loads(text) for text in mem.search("apple", min_idx=1)]
+    assert sorted(map(str, recent)) == sorted(map(str, [output("apple two"), thought("apple three")])), 'Only events numbered min_idx or later should be returned.'
+
+
+def test_none_strategy_disables_memory(monkeypatch):
+    monkeypatch.setattr(memory, "embed_model", None)
+    mem = LongTermMemory()
+    mem.add_event(thought("apple"))
+    mem.flush()
+    assert mem.search("apple") == [], 'Without an embedding model nothing should be stored.'
+    assert not hasattr(mem, "collection"), 'No Chroma collection should be created.'
+    mem.close()
+
+
+def test_async_add_and_search(mem):
+    async def run():
+        await mem.add_event_async(thought("cherry"))
+        await mem.add_event_async(output("grape"))
+        return await mem.search_async("grape", k=1)
+
+    assert [json.loads(text) for text in asyncio.run(run())] == [output("grape")]
+    assert mem._pending == 0
+
+
+def test_close_is_idempotent_and_final(mem):
+    mem.add_event(thought("apple"))
+    mem.close()
+    mem.close()
+    with pytest.raises(RuntimeError):
+        mem.add_event(thought("banana"))
+    with pytest.raises(RuntimeError):
+        asyncio.run(mem.add_event_async(thought("banana")))
+    assert mem._pending == 0, 'Rejected events should not be left pending.'
+    mem.flush()
+
+
+def test_search_after_a_closer_memory_returns_it(mem):
+    mem.add_event(thought("apple banana"))
+    mem.add_event(thought("cherry"))
+    assert [json.loads(text) for text in mem.search("apple", k=1)] == [thought("apple banana")]
+    mem.add_event(thought("apple"))
+    assert [json.loads(text) for text in mem.search("apple", k=1)] == [thought("apple")], 'A cached search should not hide a closer new memory.'
+
+
+def test_persisted_memory_is_reopened_for_the_same_task(words, monkeypatch, tmp_path):
+    monkeypatch.setattr(memory, "memory_persist_path", str(tmp_path))
+    first = LongTermMemory.for_task("pick fruit")
+    first.add_event(thought("apple"))
+    first.add_event(output("banana"))
+    first.close()
+    # Start from a fresh Chroma client, as after a restart.
+    SharedSystemClient.clear_system_cache()
+
+    reopened = LongTermMemory.for_task("pick fruit")
+    assert reopened.thought_idx == 2, 'Numbering should continue after the reopened memories.'
+    assert [json.loads(text) for text in reopened.search("banana", k=1)] == [output("banana")]
+    other = LongTermMemory.for_task("pick vegetables")
+    assert other.search("banana") == [], 'Other tasks should not see these memories.'
+    reopened.close()
+    other.close()
+
+
+def test_untyped_events_are_kept_and_bad_tags_rejected(mem):
+    async def add_untyped():
+        await mem.add_event_async({"foo": 2})
+        await mem.flush_async()
+
+    mem.add_event({"foo": 1})
+    asyncio.run(add_untyped())
+    with pytest.raises(ValueError):
+        mem.add_typed_event({"foo": 3}, "", "")
+    with pytest.raises(ValueError):
+        mem.add_typed_event({"foo": 3}, None, "")
+    mem.add_typed_event(thought("apple"), "action", "think")
+    mem.flush()
+    stored = mem.collection.get(include=["metadatas"])["metadatas"]
+    assert sorted(m["type"] for m in stored) == ["", "", "action"], 'add_event and add_event_async should store untyped events with an empty type.'
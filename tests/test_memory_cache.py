@@ -0,0 +1,131 @@
+import math
+from typing import List
+
+import numpy as np
+from llama_index.core.embeddings import BaseEmbedding
+
+from agenthub.monologue_agent.utils import cache as cache_module
+from agenthub.monologue_agent.utils.cache import CachedEmbedding, EmbeddingCache, SearchCache
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Embeds a text as [len(text), ord(first char)] and records every call."""
+
+    calls: List[List[str]] = []
+    extra: List[float] = []
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CountingEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        return [float(len(text)), float(ord(text[0]))]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.calls.append(["query", query])
+        return self._embed(query) + [1.0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        return [self._embed(text) + [0.0] + self.extra for text in texts]
+
+
+def make_cached(tmp_path, extra=()):
+    model = CountingEmbedding(model_name="counting", extra=list(extra))
+    model.calls = []
+    return model, CachedEmbedding(model, EmbeddingCache(str(tmp_path / "embeddings.sqlite3")))
+
+
+def test_embedding_cache_round_trip(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path)
+    key = EmbeddingCache.key("text|model", "hello")
+    cache.set_many({key: [0.5, -2.5, 3.0]})
+    assert cache.get_many([key, "missing"]) == {key: [0.5, -2.5, 3.0]}, 'Stored vectors should be returned exactly, and misses left out.'
+    assert EmbeddingCache(path).get_many([key]) == {key: [0.5, -2.5, 3.0]}, 'Vectors should persist across cache instances.'
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(clock)))
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), max_entries=2)
+    cache.set_many({"a": [1.0]})
+    cache.set_many({"b": [2.0]})
+    cache.get_many(["a"])
+    cache.set_many({"c": [3.0]})
+    assert cache.get_many(["a", "b", "c"]) == {"a": [1.0], "c": [3.0]}, 'The least recently used vector should be evicted.'
+
+
+def test_cached_embedding_only_embeds_misses(tmp_path):
+    model, cached = make_cached(tmp_path)
+    first = cached.get_text_embedding_batch(["aa", "b", "aa"])
+    assert model.calls == [["dimension"], ["aa", "b"]], 'Duplicate texts in a batch should be embedded once.'
+    assert first == [[2.0, 97.0, 0.0], [1.0, 98.0, 0.0], [2.0, 97.0, 0.0]], 'Results should follow the input order.'
+
+    second = cached.get_text_embedding_batch(["ccc", "b", "aa"])
+    assert model.calls[2:] == [["ccc"]], 'Only texts missing from the cache should reach the model.'
+    assert second == [[3.0, 99.0, 0.0], [1.0, 98.0, 0.0], [2.0, 97.0, 0.0]], 'Cached and new embeddings should be merged in input order.'
+
+
+def test_cached_embedding_keeps_queries_and_texts_apart(tmp_path):
+    model, cached = make_cached(tmp_path)
+    text_embedding = cached.get_text_embedding("same")
+    query_embedding = cached.get_query_embedding("same")
+    assert text_embedding != query_embedding, 'A query should not be answered with a cached text embedding.'
+    assert cached.get_query_embedding("same") == query_embedding
+    assert model.calls == [["dimension"], ["same"], ["query", "same"]], 'Each kind should be embedded once and then served from the cache.'
+
+
+def test_cached_embedding_keys_include_the_dimension(tmp_path):
+    make_cached(tmp_path)[1].get_text_embedding("aa")
+    model, cached = make_cached(tmp_path, extra=[5.0])
+    assert cached.get_text_embedding("aa") == [2.0, 97.0, 0.0, 5.0], 'A model returning a different size should not share cached vectors.'
+    assert model.calls == [["dimension"], ["aa"]]
+
+
+def test_search_cache_hits_similar_queries_with_the_same_key():
+    cache = SearchCache(size=4, threshold=0.97)
+    cache.put([1.0, 0.0, 0.0], 10, ["a"], math.inf, cache.generation)
+    assert cache.get([0.99, 0.05, 0.0], 10) == ["a"], 'A query above the threshold should hit.'
+    assert cache.get([0.99, 0.05, 0.0], 5) is None, 'A hit needs the same key.'
+    assert cache.get([0.7, 0.7, 0.0], 10) is None, 'A query below the threshold should miss.'
+
+
+def test_search_cache_evicts_first_in_first_out():
+    cache = SearchCache(size=2)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.put(vector, 10, [str(i)], math.inf, cache.generation)
+    assert cache.get([1.0, 0.0, 0.0], 10) is None, 'The oldest entry should be evicted once the cache is full.'
+    assert cache.get([0.0, 1.0, 0.0], 10) == ["1"]
+    assert cache.get([0.0, 0.0, 1.0], 10) == ["2"]
+
+
+def test_search_cache_rejects_results_older_than_a_clear():
+    cache = SearchCache()
+    generation = cache.generation
+    cache.clear()
+    cache.put([1.0, 0.0], 10, ["stale"], math.inf, generation)
+    assert cache.get([1.0, 0.0], 10) is None, 'Results read before a clear should not be cached.'
+
+
+def test_search_cache_invalidates_only_entries_new_memories_can_enter():
+    cache = SearchCache()
+    cache.put([1.0, 0.0], 10, ["near"], 0.5, cache.generation)
+    cache.put([0.0, 1.0], 10, ["short"], math.inf, cache.generation)
+    cache.put([-1.0, 0.0], 5, ["filtered"], math.inf, cache.generation)
+
+    cache.invalidate([[1.0, 3.0]], lambda key: np.array([key == 10]))
+    assert cache.get([1.0, 0.0], 10) == ["near"], 'A memory farther than every result should keep the entry.'
+    assert cache.get([0.0, 1.0], 10) is None, 'A search that returned fewer than k results should be dropped.'
+    assert cache.get([-1.0, 0.0], 5) == ["filtered"], 'Memories the key filters out should keep the entry.'
+
+    generation = cache.generation
+    cache.invalidate([[1.2, 0.1]], lambda key: np.array([True]))
+    assert cache.get([1.0, 0.0], 10) is None, 'A memory closer than the worst result should drop the entry.'
+    assert cache.generation == generation + 1, 'Inserts should make in-flight searches uncacheable.'